@@ -24,26 +24,34 @@ Notes:
 import sys
 
 # Ensure necessary modules and classes are imported
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt, QTimer, QObject, QMetaObject, pyqtSignal, pyqtSlot, QLineF
 from PyQt5.QtWidgets import (
     QApplication,
     QWidget,
     QVBoxLayout,
     QHBoxLayout,
     QPushButton,
-    QLabel,
-    QMessageBox
+    QLabel
 )
-from PyQt5.QtGui import QImage, QPixmap, QColor, QPainter, QPen
-from picamera2 import Picamera2
+from PyQt5.QtGui import QImage, QPixmap, QColor, QPainter, QPen, QSurfaceFormat
+from picamera2 import Picamera2, MappedArray
 from libcamera import controls
 import numpy as np
+import logging
 import os
 import time
 from gpiozero import Button
+import shlex
 import subprocess
-import traceback
-import atexit
+from concurrent.futures import ThreadPoolExecutor
+
+# Level-gated logging instead of bare print: a disabled level costs one
+# integer check, while every print pays a write() syscall to a possibly
+# slow stdout (serial console, SSH pipe) while holding the GIL. Startup
+# and handler messages log at INFO, failures at WARNING/ERROR; drop the
+# level to DEBUG when chasing per-frame problems.
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+log = logging.getLogger("pica")
 
 # Camera Constants and Mappings
 exposure_times = {
@@ -52,9 +60,21 @@ exposure_times = {
     '1/500': 2000, '1/1000': 1000,
 }
 button_pin = 26 # GPIO pin for the external, physical shutter release button
+SAVE_DIR = "/srv/DCIM/" # Target save directory (shared via samba)
 TIMER_DELAY_MS = 10000 # 10 seconds for self-timer
 BUTTON_BAR_HEIGHT = 36 # Height of the button bars in pixels - Change to scale for different screens / resolutions
 
+# Grid overlay line coordinates for the 720x720 preview, computed once
+# at module level (the geometry never changes). Horizontal lines are
+# shifted *up* by BUTTON_BAR_HEIGHT to compensate for the space taken
+# by the bottom button bar; vertical lines are not shifted.
+GRID_CENTER_Y = 720 // 2 - BUTTON_BAR_HEIGHT
+GRID_GR_Y1 = int(round(720 * 0.381966)) - BUTTON_BAR_HEIGHT # Golden ratio
+GRID_GR_Y2 = int(round(720 * 0.618034)) - BUTTON_BAR_HEIGHT
+GRID_CENTER_X = 720 // 2
+GRID_GR_X1 = int(round(720 * 0.381966))
+GRID_GR_X2 = int(round(720 * 0.618034))
+
 # Network Configuration Constants
 WIFI_CLIENT_CONNECTION_NAME = "preconfigured" # Name of the saved WiFi client connection in NetworkManager when set with Raspberry Imager, change if you use a different one
 AP_SSID = "3zero" # SSID for the Access Point
@@ -62,730 +82,1113 @@ AP_PASSWORD = "3zerocamera" # Password for the Access Point
 AP_CONNECTION_NAME = "CameraHotspot" # Internal name for the temporary AP connection profile in NetworkManager
 AP_STABILIZE_DELAY_S = 15 # Increased delay after starting AP for clean samba restart
 
-# --- Setup Picamera2 ---
-picam2 = Picamera2()
-general_settings = { # Default settings (Auto Exposure)
-    "AeEnable": True,
-    "AeMeteringMode": controls.AeMeteringModeEnum.Matrix,
-    "AwbEnable": True,
-    "AwbMode": controls.AwbModeEnum.Auto,
-    "AeConstraintMode": controls.AeConstraintModeEnum.Normal,
-    "AeExposureMode": controls.AeExposureModeEnum.Normal,
-}
-preview_config = picam2.create_preview_configuration(
-    main={"size": (960, 720)}, controls=general_settings
-)
-picam2.configure(preview_config)
-print("Starting Picamera2...")
-picam2.start()
-print("Picamera2 started.")
+# Ensure the save directory exists - once, at startup, instead of
+# stat'ing it on every shutter press in save_image
+try:
+    os.makedirs(SAVE_DIR, exist_ok=True)
+except Exception as e:
+    log.warning(f"Could not create save directory {SAVE_DIR}: {e}")
+
+def compute_scaler_crop(picam2):
+    # Computes a centered square crop of the sensor's active pixel area.
+    # Passing this as ScalerCrop makes the ISP deliver exactly the
+    # displayed square region, so the preview stream can be requested at
+    # a native 720x720 and no per-frame cropping is needed.
+    try:
+        active = picam2.camera_properties['PixelArrayActiveAreas']
+        if isinstance(active[0], (tuple, list)):
+            active = active[0] # Some sensors report a list of areas
+        x0, y0, active_w, active_h = active
+        side = min(active_w, active_h)
+        x_off = x0 + (active_w - side) // 2
+        y_off = y0 + (active_h - side) // 2
+        return (x_off, y_off, side, side)
+    except Exception as e:
+        log.warning(f"Could not compute ScalerCrop from camera properties: {e}")
+        return None
 
 # Helper function to run system commands
 def run_system_command(command_list, ignore_fail=False):
     """Runs a system command using subprocess and returns True on success."""
     try:
-        print(f"Executing: {' '.join(command_list)}")
+        log.info(f"Executing: {' '.join(command_list)}")
         # Using check=False and evaluating returncode manually
         result = subprocess.run(command_list, check=False, capture_output=True, text=True, timeout=30)
         if result.returncode == 0:
-            print(f"Command successful.")
+            log.info(f"Command successful.")
             return True
         else:
             # Log error even if ignoring failure for subsequent steps
-            print(f"Error executing command (Code: {result.returncode}):")
-            if result.stderr: print(f"Stderr:\n{result.stderr.strip()}")
-            if result.stdout: print(f"Stdout:\n{result.stdout.strip()}")
+            log.error(f"Error executing command (Code: {result.returncode}):")
+            if result.stderr: log.error(f"Stderr:\n{result.stderr.strip()}")
+            if result.stdout: log.error(f"Stdout:\n{result.stdout.strip()}")
             # Return True if failure is explicitly ignored, otherwise False
             return True if ignore_fail else False
     except FileNotFoundError:
-         print(f"Error: Command '{command_list[0]}' not found.")
+         log.error(f"Error: Command '{command_list[0]}' not found.")
          return False
     except subprocess.TimeoutExpired:
-         print(f"Error: Command {' '.join(command_list)} timed out.")
+         log.error(f"Error: Command {' '.join(command_list)} timed out.")
          return False
-    except Exception as e:
-         print(f"An unexpected error occurred with {' '.join(command_list)}: {e}")
-         traceback.print_exc()
+    except Exception:
+         log.exception(f"An unexpected error occurred with {' '.join(command_list)}")
          return False
 
+# Helper to run several commands in ONE sudo invocation
+def run_system_batch(script, ignore_fail=False):
+    """Runs a small shell script in a single sudo call and returns True on success.
+
+    Every separate subprocess.run(['sudo', ...]) pays fork+exec+sudo-auth
+    latency (easily 150-300 ms each on a Pi Zero 2 W), so multi-step
+    sequences are bundled into one 'sudo sh -c' call. The script runs
+    with 'set -e'; append '|| true' to steps that are allowed to fail.
+    """
+    return run_system_command(['sudo', '/bin/sh', '-c', 'set -e; ' + script], ignore_fail=ignore_fail)
+
+# Optional D-Bus control plane for NetworkManager and systemd
+# Each nmcli/systemctl subprocess costs ~100-300 ms of fork+exec on a
+# Pi Zero 2 W; the equivalent D-Bus call is near-instant. pydbus may
+# not be installed (or polkit may deny us), so every helper falls back
+# to the subprocess path on any failure.
+try:
+    from pydbus import SystemBus
+    _system_bus = SystemBus()
+    log.info("pydbus available, using D-Bus for network control where possible.")
+except Exception as e:
+    _system_bus = None
+    log.info(f"pydbus not available ({e}), using nmcli/systemctl subprocesses.")
+
+def systemd_unit_action(action, unit, ignore_fail=False):
+    #Starts/stops/enables/disables a systemd unit via D-Bus when
+    #available, falling back to a systemctl subprocess.
+    service = unit + '.service'
+    if _system_bus is not None:
+        try:
+            systemd = _system_bus.get('.systemd1')
+            if action == 'start':
+                systemd.StartUnit(service, 'replace')
+            elif action == 'stop':
+                systemd.StopUnit(service, 'replace')
+            elif action == 'enable':
+                systemd.EnableUnitFiles([service], False, True)
+            elif action == 'disable':
+                systemd.DisableUnitFiles([service], False)
+            else:
+                raise ValueError(f"unsupported action '{action}'")
+            log.info(f"D-Bus: systemctl {action} {unit} OK.")
+            return True
+        except Exception as e:
+            log.info(f"D-Bus {action} of {unit} failed ({e}), falling back to systemctl.")
+    return run_system_command(['sudo', '/bin/systemctl', action, unit], ignore_fail=ignore_fail)
+
+def _nm_connection_path(name):
+    # Looks up a saved NetworkManager connection's object path by id.
+    settings = _system_bus.get('.NetworkManager', '/org/freedesktop/NetworkManager/Settings')
+    for path in settings.ListConnections():
+        conn = _system_bus.get('.NetworkManager', path)
+        if conn.GetSettings()['connection']['id'] == name:
+            return path
+    return None
+
+def nm_connection_up(name, ignore_fail=True):
+    #Activates a saved NetworkManager connection (D-Bus, nmcli fallback).
+    if _system_bus is not None:
+        try:
+            path = _nm_connection_path(name)
+            if path is None:
+                raise RuntimeError(f"connection '{name}' not found")
+            _system_bus.get('.NetworkManager').ActivateConnection(path, '/', '/')
+            log.info(f"D-Bus: connection {name} up.")
+            return True
+        except Exception as e:
+            log.info(f"D-Bus activation of {name} failed ({e}), falling back to nmcli.")
+    return run_system_command(['sudo', '/usr/bin/nmcli', 'connection', 'up', name], ignore_fail=ignore_fail)
+
+def nm_connection_down(name, ignore_fail=True):
+    #Deactivates an active NetworkManager connection (D-Bus, nmcli fallback).
+    if _system_bus is not None:
+        try:
+            nm = _system_bus.get('.NetworkManager')
+            for path in nm.ActiveConnections:
+                if _system_bus.get('.NetworkManager', path).Id == name:
+                    nm.DeactivateConnection(path)
+                    break
+            log.info(f"D-Bus: connection {name} down.")
+            return True
+        except Exception as e:
+            log.info(f"D-Bus deactivation of {name} failed ({e}), falling back to nmcli.")
+    return run_system_command(['sudo', '/usr/bin/nmcli', 'connection', 'down', name], ignore_fail=ignore_fail)
+
+def nm_connection_delete(name, ignore_fail=True):
+    #Deletes a saved NetworkManager connection (D-Bus, nmcli fallback).
+    if _system_bus is not None:
+        try:
+            path = _nm_connection_path(name)
+            if path is not None:
+                _system_bus.get('.NetworkManager', path).Delete()
+            log.info(f"D-Bus: connection {name} deleted.")
+            return True
+        except Exception as e:
+            log.info(f"D-Bus delete of {name} failed ({e}), falling back to nmcli.")
+    return run_system_command(['sudo', '/usr/bin/nmcli', 'connection', 'delete', name], ignore_fail=ignore_fail)
+
 # Ensure WiFi Client is UP and Samba ON at Script Startup
-print("Ensuring WiFi radio and Client connection are active at startup...")
-initial_services_ok = True
-startup_commands = [
-    ['sudo', '/usr/sbin/rfkill', 'unblock', 'wifi'],
-    ['sudo', '/usr/bin/nmcli', 'connection', 'up', WIFI_CLIENT_CONNECTION_NAME],
-    ['sudo', '/bin/systemctl', 'start', 'nmbd'],
-    ['sudo', '/bin/systemctl', 'start', 'smbd']
-]
-for i, cmd in enumerate(startup_commands):
-    # Ignore failure only for 'nmcli connection up' (index 1)
-    allow_fail = (i == 1)
-    if not run_system_command(cmd, ignore_fail=allow_fail):
-        # If any command other than 'nmcli up' fails, mark startup as potentially problematic
-        if not allow_fail:
-            initial_services_ok = False
+log.info("Ensuring WiFi radio and Client connection are active at startup...")
+# One batched invocation instead of four sequential sudo calls - this is
+# on the critical path to the first preview frame. Only 'nmcli connection
+# up' may fail (already up / not configured).
+initial_services_ok = run_system_batch(
+    "/usr/sbin/rfkill unblock wifi; "
+    f"/usr/bin/nmcli connection up {shlex.quote(WIFI_CLIENT_CONNECTION_NAME)} || true; "
+    "/bin/systemctl start nmbd; "
+    "/bin/systemctl start smbd; "
+    "/bin/systemctl start pigpiod || true" # For the pigpio button backend
+)
 if initial_services_ok:
-    print("WiFi radio unblocked, Client connection up (or already up), Samba started.")
+    log.info("WiFi radio unblocked, Client connection up (or already up), Samba started.")
 else:
-    print("Warning: One or more critical startup commands failed.")
-
-# Global State Variables
-active_exposure_button = None # Tracks the currently active exposure button widget
-is_timer_countdown_active = False # Tracks if the self-timer is running
-is_wifi_on = initial_services_ok # Master WiFi state (radio on/off)
-is_ap_mode_active = False # Tracks if AP mode is intended to be active
-current_manual_settings = None # Stores the dict of manual settings if active, else None
+    log.warning("One or more critical startup commands failed.")
 
 # Common Button Style Sheet
+# Set once on the application; the "active" rule is keyed on a dynamic
+# property, so toggling a button is a cheap property change plus
+# unpolish/polish instead of a per-widget CSS re-parse and re-polish.
+# The 72x36 bar-button size also lives here: one stylesheet rule instead
+# of a setFixedSize call per button, each of which invalidates the
+# layout all the way up to the top-level window during construction.
 button_style_sheet = """
     QPushButton {
         background-color: black; color: white; font-size: 14px;
         font-weight: bold; border: none; padding: 2px;
+        min-width: 72px; max-width: 72px;
+        min-height: 36px; max-height: 36px;
     }
     QPushButton:hover { background-color: #555; }
     QPushButton:disabled { background-color: #222; color: #777; }
+    QPushButton[active="true"] { color: red; }
     """
 
-# Style sheet for active buttons (red text)
-active_style_sheet_red = button_style_sheet.replace("color: white;", "color: red;")
+def set_button_active(button, active):
+    # Toggles a button's "active" (red text) state via the dynamic
+    # property the stylesheet above selects on.
+    button.setProperty("active", "true" if active else "false")
+    button.style().unpolish(button)
+    button.style().polish(button)
 
 # Network Mode Control Functions (implemented with nmcli)
+# These only touch system services, never GUI state, so they stay
+# module-level functions; the GUI-facing halves live on PicaApp.
 def start_client_mode():
-    #Sequence to specifically activate WiFi client mode using nmcli.
-    print("FUNC: Attempting to start Client Mode...")
-    success = True
-    # Ensure WiFi radio is unblocked
-    if not run_system_command(['sudo', '/usr/sbin/rfkill', 'unblock', 'wifi']): success = False
-
-    # Re-enable and start dnsmasq if needed when going to Client Mode
-    # These might fail if dnsmasq isn't installed or managed by systemd, ignore failure.
-    print("--> Ensuring dnsmasq is enabled/started (if applicable for client mode)...")
-    run_system_command(['sudo', '/bin/systemctl', 'enable', 'dnsmasq'], ignore_fail=True)
-    run_system_command(['sudo', '/bin/systemctl', 'start', 'dnsmasq'], ignore_fail=True)
-
-    # Attempt to bring up the preconfigured client connection
-    # Allow this to fail gracefully if already up or configuration is missing
-    if success and not run_system_command(['sudo', '/usr/bin/nmcli', 'connection', 'up', WIFI_CLIENT_CONNECTION_NAME], ignore_fail=True):
-        print(f"INFO: nmcli connection up {WIFI_CLIENT_CONNECTION_NAME} finished (may have failed if already up or not configured).")
-
-    # Start Samba services for client mode file sharing
-    if success and not run_system_command(['sudo', '/bin/systemctl', 'start', 'nmbd']): success = False
-    if success and not run_system_command(['sudo', '/bin/systemctl', 'start', 'smbd']): success = False
-
-    return success
+    #Sequence to specifically activate WiFi client mode.
+    log.info("FUNC: Attempting to start Client Mode...")
+    if _system_bus is not None:
+        # D-Bus control plane: no fork/exec per step. rfkill stays a
+        # subprocess - it has no simple D-Bus equivalent.
+        if not run_system_command(['sudo', '/usr/sbin/rfkill', 'unblock', 'wifi']):
+            return False
+        # dnsmasq may not be installed; the connection may already be up
+        systemd_unit_action('enable', 'dnsmasq', ignore_fail=True)
+        systemd_unit_action('start', 'dnsmasq', ignore_fail=True)
+        nm_connection_up(WIFI_CLIENT_CONNECTION_NAME)
+        if not systemd_unit_action('start', 'nmbd'): return False
+        if not systemd_unit_action('start', 'smbd'): return False
+        return True
+    # Fallback: one batched sudo invocation. dnsmasq may not be installed
+    # and the client connection may already be up or missing, so those
+    # steps are allowed to fail with '|| true'; rfkill and Samba remain
+    # critical.
+    return run_system_batch(
+        "/usr/sbin/rfkill unblock wifi; "
+        "/bin/systemctl enable dnsmasq || true; "
+        "/bin/systemctl start dnsmasq || true; "
+        f"/usr/bin/nmcli connection up {shlex.quote(WIFI_CLIENT_CONNECTION_NAME)} || true; "
+        "/bin/systemctl start nmbd; "
+        "/bin/systemctl start smbd"
+    )
 
 def stop_client_mode():
-    #Sequence to specifically deactivate WiFi client mode using nmcli.
-    print("FUNC: Attempting to stop Client Mode...")
-    # Attempt to bring down the client connection, ignore failure if not up
-    run_system_command(['sudo', '/usr/bin/nmcli', 'connection', 'down', WIFI_CLIENT_CONNECTION_NAME], ignore_fail=True)
-    # Stop Samba services
-    run_system_command(['sudo', '/bin/systemctl', 'stop', 'smbd'], ignore_fail=True)
-    run_system_command(['sudo', '/bin/systemctl', 'stop', 'nmbd'], ignore_fail=True)
+    #Sequence to specifically deactivate WiFi client mode.
+    log.info("FUNC: Attempting to stop Client Mode...")
+    if _system_bus is not None:
+        # Every step may fail harmlessly (e.g. connection not up)
+        nm_connection_down(WIFI_CLIENT_CONNECTION_NAME)
+        systemd_unit_action('stop', 'smbd', ignore_fail=True)
+        systemd_unit_action('stop', 'nmbd', ignore_fail=True)
+    else:
+        # Fallback: bring down the client connection and stop Samba in
+        # one batch; every step may fail harmlessly.
+        run_system_batch(
+            f"/usr/bin/nmcli connection down {shlex.quote(WIFI_CLIENT_CONNECTION_NAME)} || true; "
+            "/bin/systemctl stop smbd || true; "
+            "/bin/systemctl stop nmbd || true",
+            ignore_fail=True
+        )
     # Note: We don't stop/disable dnsmasq here, only when starting AP mode.
     return True # Assume success for stopping services
 
 # Start_ap_mode: Added dnsmasq stop/disable and re-enabled Samba start
 def start_ap_mode():
-    #Sequence to enable WiFi Access Point mode using nmcli hotspot.
-    print("FUNC: Attempting to start AP Mode...")
+    #First (non-blocking) half of AP bring-up: radio, dnsmasq, hotspot.
+    #Samba is started later by PicaApp.finish_ap_bringup, once the AP
+    #network has had AP_STABILIZE_DELAY_S seconds to stabilize - the wait
+    #runs on a QTimer instead of time.sleep so the GUI thread is never
+    #blocked.
+    log.info("FUNC: Attempting to start AP Mode...")
     success = True
-    hotspot_started = False
 
-    # Ensure WiFi radio is unblocked
-    if not run_system_command(['sudo', '/usr/sbin/rfkill', 'unblock', 'wifi']):
-        print("ERROR: Failed to unblock wifi radio in start_ap_mode.")
+    # Unblock the radio and clear dnsmasq out of the way (to prevent
+    # conflicts with the nmcli hotspot). dnsmasq may not be
+    # installed/running, so those steps may fail.
+    if _system_bus is not None:
+        if run_system_command(['sudo', '/usr/sbin/rfkill', 'unblock', 'wifi']):
+            systemd_unit_action('stop', 'dnsmasq', ignore_fail=True)
+            systemd_unit_action('disable', 'dnsmasq', ignore_fail=True)
+        else:
+            log.error("Failed to unblock wifi radio in start_ap_mode.")
+            success = False
+    elif not run_system_batch(
+        "/usr/sbin/rfkill unblock wifi; "
+        "/bin/systemctl stop dnsmasq || true; "
+        "/bin/systemctl disable dnsmasq || true"
+    ):
+        log.error("Failed to unblock wifi radio in start_ap_mode.")
         success = False
 
-    # Stop and disable dnsmasq before starting nmcli hotspot
-    if success:
-        print("--> Stopping dnsmasq (if running)...")
-        # Ignore failure if dnsmasq is not running or not installed
-        run_system_command(['sudo', '/bin/systemctl', 'stop', 'dnsmasq'], ignore_fail=True)
-        print("--> Disabling dnsmasq (to prevent conflicts)...")
-        # Ignore failure if dnsmasq cannot be disabled
-        run_system_command(['sudo', '/bin/systemctl', 'disable', 'dnsmasq'], ignore_fail=True)
-
     # Attempt to start the nmcli hotspot
     if success:
-        if run_system_command([
+        if not run_system_command([
             'sudo', '/usr/bin/nmcli', 'device', 'wifi', 'hotspot',
             'ifname', 'wlan0', 'con-name', AP_CONNECTION_NAME,
             'ssid', AP_SSID, 'password', AP_PASSWORD
         ]):
-            hotspot_started = True
-        else:
-            print("ERROR: Failed to start nmcli hotspot.")
+            log.error("Failed to start nmcli hotspot.")
             success = False
 
-    # If hotspot started, WAIT before starting Samba
-    if success and hotspot_started:
-        print(f"Waiting {AP_STABILIZE_DELAY_S} seconds for AP network to stabilize...")
-        time.sleep(AP_STABILIZE_DELAY_S) # Use constant for delay
-
-        # Re-enabled Samba Start for AP Mode
-        print("--> Starting Samba services (nmbd, smbd) for AP mode...")
-        if not run_system_command(['sudo', '/bin/systemctl', 'start', 'nmbd']):
-            print("ERROR: Failed to start nmbd in AP mode.")
-            success = False # Mark as failure if Samba doesn't start
-        if not run_system_command(['sudo', '/bin/systemctl', 'start', 'smbd']):
-            print("ERROR: Failed to start smbd in AP mode.")
-            success = False # Mark as failure if Samba doesn't start
-        # End Re-enabled Section
-
     # If any critical step failed, return False
     return success
 
 def stop_ap_mode():
     #Sequence to disable WiFi Access Point mode created by nmcli.
-    print("FUNC: Attempting to stop AP Mode...")
-    # Bring down and delete the temporary AP connection
-    run_system_command(['sudo', '/usr/bin/nmcli', 'connection', 'down', AP_CONNECTION_NAME], ignore_fail=True)
-    run_system_command(['sudo', '/usr/bin/nmcli', 'connection', 'delete', AP_CONNECTION_NAME], ignore_fail=True)
-    # Stop Samba services if they were running in AP mode
-    run_system_command(['sudo', '/bin/systemctl', 'stop', 'smbd'], ignore_fail=True)
-    run_system_command(['sudo', '/bin/systemctl', 'stop', 'nmbd'], ignore_fail=True)
+    log.info("FUNC: Attempting to stop AP Mode...")
+    # Bring down and delete the temporary AP connection, then stop Samba;
+    # every step may fail harmlessly.
+    if _system_bus is not None:
+        nm_connection_down(AP_CONNECTION_NAME)
+        nm_connection_delete(AP_CONNECTION_NAME)
+        systemd_unit_action('stop', 'smbd', ignore_fail=True)
+        systemd_unit_action('stop', 'nmbd', ignore_fail=True)
+    else:
+        run_system_batch(
+            f"/usr/bin/nmcli connection down {shlex.quote(AP_CONNECTION_NAME)} || true; "
+            f"/usr/bin/nmcli connection delete {shlex.quote(AP_CONNECTION_NAME)} || true; "
+            "/bin/systemctl stop smbd || true; "
+            "/bin/systemctl stop nmbd || true",
+            ignore_fail=True
+        )
     # Note: We don't explicitly re-enable/start dnsmasq here.
     # It will be handled by start_client_mode if switching back.
     return True # Assume success for stopping services
 # End Network Mode Control Functions
 
-# Handler Functions
-def reapply_manual_exposure_if_needed():
-    """Checks if manual exposure was active and re-applies it."""
-    global current_manual_settings, picam2
-    if current_manual_settings:
+# Grid Overlay Pixmap
+def build_grid_pixmap():
+    # Renders the grid overlay once into a transparent 720x720 pixmap.
+    # The geometry is constant (fixed crop size, fixed BUTTON_BAR_HEIGHT),
+    # so there is no need to redraw six lines on every preview frame -
+    # GridOverlay just blits this pixmap with a single drawPixmap.
+    pix = QPixmap(720, 720)
+    pix.fill(Qt.transparent)
+    painter = QPainter(pix)
+    pen = QPen(QColor(255, 255, 255, 100)) # Semi-transparent white
+    pen.setWidth(0) # Hairline width
+    painter.setPen(pen)
+
+    max_xy = 719 # Max X/Y coordinate of the 720x720 pixmap
+
+    # Horizontal and vertical lines at the module-level GRID_* constants,
+    # submitted in one drawLines batch with a single pen-state validation
+    # instead of six separate drawLine calls.
+    grid_lines = [
+        QLineF(0, GRID_CENTER_Y, max_xy, GRID_CENTER_Y),
+        QLineF(0, GRID_GR_Y1, max_xy, GRID_GR_Y1),
+        QLineF(0, GRID_GR_Y2, max_xy, GRID_GR_Y2),
+        QLineF(GRID_CENTER_X, 0, GRID_CENTER_X, max_xy),
+        QLineF(GRID_GR_X1, 0, GRID_GR_X1, max_xy),
+        QLineF(GRID_GR_X2, 0, GRID_GR_X2, max_xy),
+    ]
+    painter.drawLines(grid_lines)
+
+    painter.end()
+    return pix
+
+# Rate-limited error reporting for the per-frame paths. If the camera
+# hiccups and throws continuously, a full traceback per frame would
+# saturate the console (and the SD card log) and strangle the preview.
+_preview_err_count = 0
+_preview_err_last_ts = 0.0
+
+def report_preview_error(e):
+    # Logs at most one line per second, with a count of suppressed errors.
+    global _preview_err_count, _preview_err_last_ts
+    _preview_err_count += 1
+    now = time.monotonic()
+    if now - _preview_err_last_ts > 1.0:
+        log.error(f"Preview errors in the last interval: {_preview_err_count}, last: {e}")
+        _preview_err_last_ts = now
+        _preview_err_count = 0
+
+# Preview Widget (paints the frame directly, no QPixmap conversion)
+class PreviewWidget(QWidget):
+    # Custom preview surface. QLabel.setPixmap forces a QImage->QPixmap
+    # format conversion into the display pixel format on every frame;
+    # painting the QImage directly in paintEvent skips that conversion
+    # entirely on the software-rendered Pi display path.
+    def __init__(self, frame_images, parent=None):
+        super().__init__(parent)
+        # The persistent buffer QImages are handed in by reference, so
+        # the per-frame slot below does attribute lookups on self instead
+        # of module-global lookups
+        self._images = frame_images
+        self._qim = None # Latest frame as a QImage (wraps a frame buffer)
+        # Every paint covers the full widget with the frame, so tell Qt
+        # not to erase/fill the background first - that is a full-surface
+        # memory pass per frame on the raster backend
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+        self.setAttribute(Qt.WA_NoSystemBackground)
+
+    @pyqtSlot(int)
+    def update_frame(self, idx):
+        # Queued slot for the frame_ready signal. Decorated with pyqtSlot
+        # so PyQt dispatches through the C++ slot path instead of the
+        # per-emission Python wrapper undecorated callables get (which is
+        # also the documented source of slow leaks on high-rate signals).
         try:
-            print("Re-applying manual exposure settings after capture...")
-            picam2.set_controls(current_manual_settings)
-            print("Manual exposure re-applied.")
+            self._qim = self._images[idx]
+            self.update()
         except Exception as e:
-            print(f"Error re-applying manual exposure settings: {e}")
-
-def on_save_button_clicked():
-    # Handles clicks on the Save ('O') button.
-    global is_timer_countdown_active
-    if is_timer_countdown_active:
-        print("Save button ignored, timer is active.")
-        return # Do nothing if timer is running
-    else:
-        print("GUI Save ('O') button pressed, saving image immediately.")
-        save_image()
-        # Re-apply manual exposure if it was set
-        reapply_manual_exposure_if_needed()
-
-def on_timer_button_clicked():
-    #Handles clicks on the Timer ('10s') button.
-    global is_timer_countdown_active, btn_timer
-    if is_timer_countdown_active:
-        # Cancel the timer
-        is_timer_countdown_active = False
-        # No need to explicitly stop QTimer.singleShot, just prevent action in callback
-        btn_timer.setStyleSheet(button_style_sheet) # Reset style using original base style
-        print("Self-timer cancelled.")
-    else:
-        # Start the timer
-        is_timer_countdown_active = True
-        btn_timer.setStyleSheet(active_style_sheet_red) # Active style (red text)
-        print("Self-timer started (10s)...")
-        QTimer.singleShot(TIMER_DELAY_MS, delayed_capture_and_reset)
-
-def on_wifi_button_clicked():
-    #Handles clicks on the 'WiFi' button as master ON/OFF switch.
-    global is_wifi_on, is_ap_mode_active, btn_wifi, btn_ap
-    target_state_on = not is_wifi_on # Determine desired state
-
-    if target_state_on:
-        print("WiFi button: Turning ON (Activating Client mode)...")
-        # Ensure AP mode state variable is false and button looks inactive
-        is_ap_mode_active = False
-        if btn_ap: btn_ap.setStyleSheet(button_style_sheet) # Use original base style
-
-        if start_client_mode():
-            print("WiFi ON (Client Mode).")
-            is_wifi_on = True
-            btn_wifi.setStyleSheet(active_style_sheet_red) # Active style
-            if btn_ap: btn_ap.setEnabled(True) # Enable AP button
-        else:
-            print("ERROR: Failed to start Client mode services. Turning radio off.")
-            run_system_command(['sudo', '/usr/sbin/rfkill', 'block', 'wifi']) # Block radio on failure
-            is_wifi_on = False
-            btn_wifi.setStyleSheet(button_style_sheet) # Inactive style
-            if btn_ap: btn_ap.setEnabled(False) # Disable AP button
-    else:
-        # Turning WiFi OFF
-        print("WiFi button: Turning OFF...")
-        stop_success = False
-        if is_ap_mode_active:
-            print("Stopping AP mode services...")
-            stop_success = stop_ap_mode() # Calls function with real commands
-        else:
-            # If not in AP mode, must be in Client mode (or trying to be)
-            print("Stopping Client mode services...")
-            stop_success = stop_client_mode() # Calls function with real commands
-
-        print("Blocking WiFi radio...")
-        rfkill_success = run_system_command(['sudo', '/usr/sbin/rfkill', 'block', 'wifi'])
-
-        if stop_success and rfkill_success:
-            print("WiFi OFF.")
-            is_wifi_on = False
-            is_ap_mode_active = False # Ensure AP state is also off
-            btn_wifi.setStyleSheet(button_style_sheet) # Inactive style for WiFi button
-            if btn_ap:
-                btn_ap.setStyleSheet(button_style_sheet) # Inactive style for AP button
-                btn_ap.setEnabled(False) # Disable AP button
-        else:
-            print("ERROR: Failed to properly turn off WiFi/Services. State may be inconsistent.")
-            # Attempt to revert visual state if turn-off failed
-            is_wifi_on = True # Assume it's still effectively on
-            btn_wifi.setStyleSheet(active_style_sheet_red) # Active style
-            if btn_ap: btn_ap.setEnabled(True) # Keep AP button enabled
-
-def on_ap_button_clicked():
-    #Handles clicks on the 'AP' button to switch network mode.
-    global is_ap_mode_active, is_wifi_on, btn_ap
-    if not is_wifi_on:
-        print("AP button clicked, but WiFi is OFF. Ignoring.")
-        return # Do nothing if WiFi master switch is off
-
-    target_ap_on = not is_ap_mode_active # Determine desired AP state
-
-    success = False
-    if target_ap_on:
-        # Switching Client -> AP
-        print("AP button: Attempting switch Client -> AP mode...")
-        if stop_client_mode():
-            # Now calls start_ap_mode which includes starting Samba
-            if start_ap_mode():
-                success = True
-            else:
-                print("ERROR: Failed to start AP mode services after stopping client. Attempting to revert to Client mode...")
-                start_client_mode() # Try to go back to client mode
-        else:
-            print("ERROR: Failed to stop client mode services before starting AP.")
+            report_preview_error(e) # Rate-limited; no traceback on the hot path
 
-        if success:
-            print("Successfully switched to AP mode.")
-            is_ap_mode_active = True
-            btn_ap.setStyleSheet(active_style_sheet_red) # Active style
-        else:
-            print("Failed to switch to AP mode. Reverting selection visuals.")
-            is_ap_mode_active = False # Stay in client mode logically
-            btn_ap.setStyleSheet(button_style_sheet) # Inactive style
-    else:
-        # Switching AP -> Client
-        print("AP button: Attempting switch AP -> Client mode...")
-        if stop_ap_mode():
-            if start_client_mode(): # Calls function with dnsmasq enable/start
-                success = True
-            else:
-                print("ERROR: Failed to start Client mode services after stopping AP. Attempting to revert to AP mode...")
-                start_ap_mode() # Try to go back to AP mode
-        else:
-            print("ERROR: Failed to stop AP mode services before starting client.")
+    def paintEvent(self, event):
+        # Pure frame blit - the grid lives in the stacked GridOverlay
+        painter = QPainter(self)
+        if self._qim is not None:
+            painter.drawImage(0, 0, self._qim)
+        painter.end()
 
-        if success:
-            print("Successfully switched to Client mode.")
-            is_ap_mode_active = False
-            btn_ap.setStyleSheet(button_style_sheet) # Inactive style
-        else:
-            print("Failed to switch to Client mode. Reverting selection visuals.")
-            is_ap_mode_active = True # Stay in AP mode logically
-            btn_ap.setStyleSheet(active_style_sheet_red) # Active style
-
-# Exposure Button Handler
-def on_exposure_button_clicked(button_widget, label):
-    #Handles clicks on the bottom exposure time buttons.
-    # Access global variables
-    global active_exposure_button, picam2, general_settings, exposure_times, preview_config, current_manual_settings
-    sender = button_widget
-    if not sender:
-        return # Exit if sender is somehow invalid
-
-    if active_exposure_button == sender:
-        # --- Revert to auto exposure ---
-        sender.setStyleSheet(button_style_sheet) # Deactivate button visually
-        active_exposure_button = None
-        current_manual_settings = None # Clear stored manual settings
-        print("Attempting to re-enable Auto Exposure...")
-        try:
-            # Try set_controls first (less disruptive)
-            # Use general_settings which now doesn't explicitly set AnalogueGain
-            picam2.set_controls(general_settings)
-            print("Auto Exposure Re-enabled using set_controls")
-        except Exception as e1:
-            print(f"set_controls failed ({e1}), attempting configure...")
-            try:
-                # Fallback to reconfiguring if set_controls fails
-                picam2.stop()
-                # Create new config using general_settings (without AnalogueGain)
-                new_config = picam2.create_preview_configuration(
-                    main={"size": (960, 720)}, controls=general_settings
-                )
-                picam2.configure(new_config)
-                picam2.start()
-                print("Auto Exposure Re-enabled using configure")
-            except Exception as e2:
-                print(f"Error re-enabling auto exposure via configure: {e2}")
-    else:
-        # Set manual exposure
-        # Deactivate previously active button (if any)
-        if active_exposure_button:
-            active_exposure_button.setStyleSheet(button_style_sheet)
-
-        # Activate the newly clicked button
-        sender.setStyleSheet(active_style_sheet_red) # Use red text style
-        active_exposure_button = sender
-        exposure_time = exposure_times[label]
-        # Define the manual settings dictionary
-        manual_settings = {
-            "AnalogueGain": 1.0, # Explicitly set gain for manual mode
-            "AeEnable": False, # Disable Auto Exposure
-            "ExposureTime": exposure_time, # Set manual time
-            "AwbEnable": True, # Keep Auto White Balance
+# Grid Overlay Widget (stacked above the preview)
+class GridOverlay(QWidget):
+    # Transparent child widget that paints the cached grid pixmap above
+    # the preview. Keeping the grid out of PreviewWidget.paintEvent makes
+    # the per-frame path a pure drawImage; the static overlay is simply
+    # composited on top by Qt.
+    def __init__(self, grid_pix, parent=None):
+        super().__init__(parent)
+        self._pix = grid_pix # Rendered once by build_grid_pixmap
+        self.setAttribute(Qt.WA_TransparentForMouseEvents) # Clicks pass through
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.drawPixmap(0, 0, self._pix)
+        painter.end()
+
+# Shutdown Confirmation Overlay (non-modal)
+class ConfirmOverlay(QWidget):
+    # Non-modal replacement for QMessageBox.question: a modal dialog
+    # spins its own event loop and freezes the preview until dismissed,
+    # while this overlay just sits on top of the preview and leaves the
+    # rest of the app running.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setStyleSheet("background-color: rgba(0, 0, 0, 200);")
+        # Plain QWidget subclasses don't paint stylesheet backgrounds
+        # unless told to - without this the dimming backdrop is invisible
+        self.setAttribute(Qt.WA_StyledBackground, True)
+        layout = QVBoxLayout()
+        question = QLabel("Shut down the Raspberry Pi?")
+        question.setStyleSheet("color: white; font-size: 18px; font-weight: bold; background: transparent;")
+        question.setAlignment(Qt.AlignCenter)
+        layout.addWidget(question)
+        button_row = QHBoxLayout()
+        self.btn_confirm = QPushButton("Shut down")
+        self.btn_cancel = QPushButton("Cancel")
+        for btn in (self.btn_confirm, self.btn_cancel):
+            # Twice the bar-button size for fat-finger safety; the
+            # widget-level rule overrides the app-level 72x36 rule
+            btn.setStyleSheet("min-width: 144px; max-width: 144px; min-height: 72px; max-height: 72px;")
+            button_row.addWidget(btn)
+        layout.addLayout(button_row)
+        self.setLayout(layout)
+        self.btn_confirm.clicked.connect(self.on_confirm, Qt.DirectConnection)
+        self.btn_cancel.clicked.connect(self.on_cancel, Qt.DirectConnection)
+        self.hide()
+
+    def ask(self):
+        # Covers the whole parent window and raises above the preview
+        self.setGeometry(self.parent().rect())
+        self.raise_()
+        self.show()
+
+    @pyqtSlot()
+    def on_confirm(self):
+        self.hide()
+        log.info("User confirmed shutdown. Executing shutdown command...")
+        if not run_system_command(['sudo', '/sbin/shutdown', '-h', 'now']):
+            log.error("Failed to execute shutdown command. Check logs or sudoers configuration.")
+
+    @pyqtSlot()
+    def on_cancel(self):
+        self.hide()
+        log.info("Shutdown cancelled by user.")
+
+# --- Application Object ---
+class PicaApp(QObject):
+    # Owns all camera and GUI state. Handlers and the per-frame paths
+    # reach state through self (LOAD_FAST on self + LOAD_ATTR) instead of
+    # module globals (LOAD_GLOBAL + dict probe), and proper_cleanup checks
+    # plain attributes instead of probing globals().
+
+    # Bridges Picamera2's request callback (camera thread) to the GUI
+    # thread via a queued Qt signal carrying the ready buffer's index.
+    frame_ready = pyqtSignal(int)
+
+    def __init__(self, initial_services_ok):
+        super().__init__()
+        # State (formerly module-level globals)
+        self.active_exposure_button = None # Tracks the currently active exposure button widget
+        self.is_timer_countdown_active = False # Tracks if the self-timer is running
+        self.is_wifi_on = initial_services_ok # Master WiFi state (radio on/off)
+        self.is_ap_mode_active = False # Tracks if AP mode is intended to be active
+        self.current_manual_settings = None # Stores the dict of manual settings if active, else None
+        # Set to None up front so proper_cleanup can run safely even if
+        # __init__ fails partway through
+        self.picam2 = None
+        self.capture_button = None
+
+        # --- Setup Picamera2 ---
+        self.picam2 = Picamera2()
+        self.general_settings = { # Default settings (Auto Exposure)
+            "AeEnable": True,
+            "AeMeteringMode": controls.AeMeteringModeEnum.Matrix,
+            "AwbEnable": True,
             "AwbMode": controls.AwbModeEnum.Auto,
+            "AeConstraintMode": controls.AeConstraintModeEnum.Normal,
+            "AeExposureMode": controls.AeExposureModeEnum.Normal,
         }
-        # Store the settings globally
-        current_manual_settings = manual_settings
-        print(f"Attempting to set Manual Exposure: {label} ({exposure_time} us)")
+        scaler_crop = compute_scaler_crop(self.picam2)
+        if scaler_crop:
+            self.general_settings["ScalerCrop"] = scaler_crop
+        # BGR888 in Picamera2/libcamera naming is R,G,B byte order in
+        # memory - exactly what QImage.Format_RGB888 expects, so the ISP
+        # hands over frames Qt can paint with no channel swap and no
+        # fourth padding byte: 3 bytes/pixel instead of 4, i.e. 25% less
+        # copy and paint bandwidth per frame.
+        preview_config = self.picam2.create_preview_configuration(
+            main={"size": (720, 720), "format": "BGR888"}, controls=self.general_settings
+        )
+        self.picam2.configure(preview_config)
+        # Still capture configurations are created once, not per shutter
+        # press - create_still_configuration allocates and validates a
+        # config dict each time, which sits directly on the shutter-lag
+        # path.
+        # YUV420 is 1.5 bytes/pixel vs 3 for an RGB format - half the
+        # memory traffic for a full-resolution IMX477 frame, and the JPEG
+        # encoder consumes YUV directly, so the capture stall is visibly
+        # shorter.
+        self.still_config_auto = self.picam2.create_still_configuration(
+            main={"format": "YUV420", "size": self.picam2.sensor_resolution}
+            # No explicit controls means auto exposure is used for the capture
+        )
+        self.still_config_manual = None # Rebuilt whenever manual exposure changes
+        log.info("Starting Picamera2...")
+        self.picam2.start()
+        log.info("Picamera2 started.")
+
+        # Two persistent buffers the camera callback alternates between,
+        # each wrapped by a persistent QImage. One copy is unavoidable
+        # because the frame crosses threads, but nothing is allocated per
+        # frame: the camera fills one buffer while Qt may still be
+        # painting the other.
+        self.frame_buffers = [np.empty((720, 720, 3), dtype=np.uint8) for _ in range(2)]
+        self.frame_images = [
+            QImage(buf.data, 720, 720, buf.strides[0], QImage.Format_RGB888)
+            for buf in self.frame_buffers
+        ]
+        self.frame_write_idx = 0 # Buffer the next frame will be copied into
+        self.frame_ready_idx = 0 # Last fully written buffer (always the other one)
+        # Latest-wins coalescing flag: True while a frame_ready delivery
+        # is sitting in the GUI event queue. Plain bool - assignments are
+        # atomic under the GIL, and the worst race outcome is one extra
+        # or one deferred repaint.
+        self.frame_pending = False
+
+        # Define gpiozero Button Object
         try:
-            # Try set_controls first
-            picam2.set_controls(manual_settings)
-            print(f"Manual Exposure Set using set_controls")
-        except Exception as e1:
-            print(f"set_controls failed ({e1}), attempting configure...")
+            # Prefer the pigpio pin factory: the default RPi.GPIO backend
+            # polls the pin from Python (which costs CPU the preview loop
+            # needs on the Zero 2 W's single busy core), while the pigpio
+            # daemon watches it via epoll and debounces with a hardware
+            # glitch filter instead of gpiozero's software bounce_time.
             try:
-                # Fallback to reconfiguring
-                picam2.stop()
-                new_config = picam2.create_preview_configuration(
-                    main={"size": (960, 720)}, controls=manual_settings
-                )
-                picam2.configure(new_config)
-                picam2.start()
-                print(f"Manual Exposure Set using configure")
-            except Exception as e2:
-                 print(f"Error setting manual exposure via configure: {e2}")
-# End on_exposure_button_clicked
-
-
-def on_shutdown_button_clicked():
-    #Handles clicks on the Shutdown ('I/O') button.
-    global window
-    print("Shutdown button clicked.")
-    reply = QMessageBox.question(window,
-                                 'Confirm Shutdown',
-                                 'Are you sure you want to shut down the Raspberry Pi?',
-                                 QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
-                                 QMessageBox.StandardButton.No) # Default to No
-    if reply == QMessageBox.StandardButton.Yes:
-        print("User confirmed shutdown. Executing shutdown command...")
-        command = ['sudo', '/sbin/shutdown', '-h', 'now']
-        if not run_system_command(command):
-            # Show error message if shutdown command fails
-            QMessageBox.critical(window, "Shutdown Error", "Failed to execute shutdown command. Check logs or sudoers configuration.")
-    else:
-        print("Shutdown cancelled by user.")
-
-# Preview Update Function (With Grid)
-def update_preview(label):
-    #Captures a frame, draws a grid overlay, and updates the preview label.
-    try:
-        # Capture frame
-        array = picam2.capture_array("main")
-        height, width, channels = array.shape
-        bytesPerLine = 4 * width # RGBA8888 format
-        qim = QImage(array.data, width, height, bytesPerLine, QImage.Format_RGBA8888)
-
-        # Crop to square (720x720) from center width, top height
-        crop_w = 720
-        crop_h = 720
-        crop_x = (width - crop_w) // 2
-        crop_y = 0 # Crop from the top
-        cropped_qim = qim.copy(crop_x, crop_y, crop_w, crop_h)
-        pix = QPixmap.fromImage(cropped_qim)
-
-        # Draw Grid Overlay using QPainter
-        painter = QPainter(pix)
-        pen_color = QColor(255, 255, 255, 100) # Semi-transparent white
-        pen = QPen(pen_color)
-        pen.setWidth(0) # Hairline width
-        painter.setPen(pen)
-
-        w = pix.width()
-        h = pix.height()
-        w_m1 = w - 1 # Max X coordinate
-        h_m1 = h - 1 # Max Y coordinate
-
-        # Golden Ratio lines calculation (relative to cropped image dimensions)
-        base_center_y = h // 2
-        base_gr_y1 = int(round(h * 0.381966))
-        base_gr_y2 = int(round(h * 0.618034))
-        center_x = w // 2
-        gr_x1 = int(round(w * 0.381966))
-        gr_x2 = int(round(w * 0.618034))
-
-        # Adjust Y coordinates for the button bar height visually
-        # Note: This shifts the grid *up* relative to the image content
-        # to compensate for the space taken by the bottom button bar.
-        y_shift = BUTTON_BAR_HEIGHT
-        shifted_center_y = base_center_y - y_shift
-        shifted_gr_y1 = base_gr_y1 - y_shift
-        shifted_gr_y2 = base_gr_y2 - y_shift
-
-        # Draw horizontal lines (shifted)
-        painter.drawLine(0, shifted_center_y, w_m1, shifted_center_y)
-        painter.drawLine(0, shifted_gr_y1, w_m1, shifted_gr_y1)
-        painter.drawLine(0, shifted_gr_y2, w_m1, shifted_gr_y2)
-        # Draw vertical lines (not shifted)
-        painter.drawLine(center_x, 0, center_x, h_m1)
-        painter.drawLine(gr_x1, 0, gr_x1, h_m1)
-        painter.drawLine(gr_x2, 0, gr_x2, h_m1)
+                from gpiozero.pins.pigpio import PiGPIOFactory
+                # On the pigpio factory, gpiozero maps bounce_time onto
+                # the daemon's glitch filter, so the 20 ms debounce runs
+                # in pigpiod rather than in Python
+                self.capture_button = Button(button_pin, pull_up=True, bounce_time=0.02, pin_factory=PiGPIOFactory())
+                log.info(f"gpiozero button initialized for pin {button_pin} (pigpio factory, 20 ms glitch filter).")
+            except Exception as e:
+                # pigpiod not running or library missing - fall back to the
+                # default factory with software debounce so the button still works
+                log.info(f"pigpio pin factory unavailable ({e}), falling back to default factory.")
+                if self.capture_button is not None:
+                    # Close whatever the failed pigpio attempt left behind
+                    # so the pin is free for the default factory
+                    try:
+                        self.capture_button.close()
+                    except Exception:
+                        pass
+                    self.capture_button = None
+                self.capture_button = Button(button_pin, pull_up=True, bounce_time=0.3) # Debounce time
+                log.info(f"gpiozero button initialized for pin {button_pin} (default factory).")
+            # Assign the handler method to the button's press event
+            self.capture_button.when_pressed = self.on_physical_button
+        except Exception:
+            # Catch errors during button initialization (e.g., pin unavailable, library issues)
+            log.exception(f"Initializing gpiozero Button on pin {button_pin} failed - physical button capture will NOT work.")
+
+        # --- GUI Setup ---
+        self.grid_pix = build_grid_pixmap() # QPixmap needs the QApplication to exist
+        # Self-timer: one reusable single-shot QTimer instead of
+        # allocating a fresh timer object on every press via
+        # QTimer.singleShot
+        self.self_timer = QTimer()
+        self.self_timer.setSingleShot(True)
+        self.self_timer.timeout.connect(self.delayed_capture_and_reset, Qt.DirectConnection)
+        self.window = QWidget()
+        self.window.setStyleSheet("background-color: black;")
+        self.window.setFixedSize(720, 792) # Fixed size: 720 width, 720 preview + 2*36 button bars
+        self.window.setWindowFlags(Qt.FramelessWindowHint) # Remove window decorations
+        self.confirm_overlay = ConfirmOverlay(self.window) # Non-modal shutdown confirmation
+
+        # Main vertical layout
+        main_layout = QVBoxLayout()
+        main_layout.setContentsMargins(0, 0, 0, 0) # No margins
+        main_layout.setSpacing(0) # No spacing between elements
+
+        # --- Top Button Bar GUI ---
+        top_button_layout = QHBoxLayout()
+        top_button_layout.setContentsMargins(0, 0, 0, 0)
+        top_button_layout.setSpacing(0)
+        # Create Buttons
+        self.btn_save = QPushButton("O") # Capture/Save button
+        self.btn_save.clicked.connect(self.on_save_button_clicked, Qt.DirectConnection)
+
+        self.btn_timer = QPushButton("10s") # Self-timer button
+        self.btn_timer.clicked.connect(self.on_timer_button_clicked, Qt.DirectConnection)
+
+        self.btn_ap = QPushButton("AP") # Access Point mode button
+        self.btn_ap.clicked.connect(self.on_ap_button_clicked, Qt.DirectConnection)
+
+        self.btn_wifi = QPushButton("WiFi") # Master WiFi on/off button
+        # Set initial active state based on startup check
+        set_button_active(self.btn_wifi, self.is_wifi_on)
+        self.btn_wifi.clicked.connect(self.on_wifi_button_clicked, Qt.DirectConnection)
+
+        self.btn_shutdown = QPushButton("I/O") # Shutdown button
+        self.btn_shutdown.clicked.connect(self.on_shutdown_button_clicked, Qt.DirectConnection)
+
+        # Set initial enabled state for AP button based on wifi state
+        if not self.is_wifi_on:
+            self.btn_ap.setEnabled(False)
+
+        # Add Widgets to TOP button layout: O | 10s | Stretch | WiFi | AP | I/O
+        top_button_layout.addWidget(self.btn_save)
+        top_button_layout.addWidget(self.btn_timer)
+        top_button_layout.addStretch(1) # Pushes right-side buttons to the right
+        top_button_layout.addWidget(self.btn_wifi)
+        top_button_layout.addWidget(self.btn_ap)
+        top_button_layout.addWidget(self.btn_shutdown)
+
+        main_layout.addLayout(top_button_layout) # Add top bar to main layout
+
+        # --- Preview Widget GUI ---
+        self.preview_widget = PreviewWidget(self.frame_images) # Widget that paints the camera preview
+        self.preview_widget.setFixedSize(720, 720) # Square preview area
+        self.preview_widget.setStyleSheet("margin: 0px; padding: 0px; border: 0px;") # Ensure no extra space
+        main_layout.addWidget(self.preview_widget) # Add preview widget to main layout
+        # Stack the static grid overlay on top of the preview widget
+        self.grid_overlay = GridOverlay(self.grid_pix, self.preview_widget)
+        self.grid_overlay.setGeometry(0, 0, 720, 720)
+        self.grid_overlay.raise_()
+
+        # Bottom Button Bar GUI (Exposure Times)
+        bottom_button_layout = QHBoxLayout()
+        bottom_button_layout.setContentsMargins(0, 0, 0, 0)
+        bottom_button_layout.setSpacing(0)
+        # Create buttons for each exposure time
+        self.exposure_label_by_btn = {} # Maps each exposure QPushButton to its label
+        for label in exposure_times.keys():
+            button = QPushButton(label)
+            # All exposure buttons share one slot; the handler recovers
+            # the pressed button via sender() and this mapping
+            self.exposure_label_by_btn[button] = label
+            button.clicked.connect(self.on_exposure_button_clicked, Qt.DirectConnection)
+            bottom_button_layout.addWidget(button)
+        main_layout.addLayout(bottom_button_layout) # Add bottom bar to main layout
+
+        # Finalize Layout & Show Window
+        self.window.setLayout(main_layout)
+        self.window.showFullScreen() # Show the window in full screen mode
+        # Flush the pending show/expose events now, so the native window
+        # surface is created and painted once before the camera callback
+        # below starts pushing frames - otherwise the first frames race
+        # the synchronous surface creation on the KMS/DRM path and the
+        # first preview paint can slip a vblank.
+        QApplication.processEvents()
+
+        # Setup Push-Based Preview Updates
+        # Frames are pushed from Picamera2's request callback instead of
+        # polled on a wall-clock timer: no idle wakeups when no frame
+        # arrived, and no extra timer interval of latency when one did.
+        self.frame_ready.connect(self.on_frame_ready, Qt.QueuedConnection)
+        log.info("Installing camera frame callback...")
+        self.picam2.post_callback = self.on_camera_frame
+
+    def on_camera_frame(self, request):
+        # Picamera2 post_callback - runs on the camera thread for every
+        # completed request, with zero-copy access to the DMA buffer.
+        # Producer side of a bounded latest-wins queue of depth 1: if a
+        # delivery is already queued, only the buffers/index are updated
+        # and no second emission is queued, so a busy GUI thread (style
+        # transitions, capture handling) can never accumulate a backlog
+        # of stale repaints - it just paints the newest frame next time
+        # the event loop comes around.
+        try:
+            idx = self.frame_write_idx
+            with MappedArray(request, "main") as m:
+                if m.array.shape != self.frame_buffers[idx].shape:
+                    # The callback also fires for the sensor-resolution
+                    # still requests completed while save_image has the
+                    # still configuration active - those are not preview
+                    # frames, skip them
+                    return
+                np.copyto(self.frame_buffers[idx], m.array)
+            self.frame_write_idx = idx ^ 1 # Next frame goes into the other buffer
+            self.frame_ready_idx = idx
+            if not self.frame_pending:
+                self.frame_pending = True
+                self.frame_ready.emit(idx)
+        except Exception as e:
+            report_preview_error(e)
+
+    @pyqtSlot(int)
+    def on_frame_ready(self, idx):
+        # Consumer side, on the GUI thread via the queued frame_ready
+        # connection. Clears the pending flag first, then paints the
+        # *latest* completed buffer - which may be newer than the emitted
+        # idx if frames arrived while this delivery waited in the event
+        # queue. frame_ready_idx is always the buffer the camera thread
+        # is NOT currently writing, so the paint is race-free.
+        self.frame_pending = False
+        self.preview_widget.update_frame(self.frame_ready_idx)
+
+    # Handler Functions
+    def reapply_manual_exposure_if_needed(self):
+        """Re-applies manual exposure after a capture.
+
+        The switch back to the preview configuration always drops the
+        manual controls: configure() overwrites the runtime controls with
+        the config's own, and the preview config carries the auto
+        general_settings. So the controls are re-sent unconditionally -
+        set_controls just queues values for a coming request and returns
+        immediately, which is far cheaper than any metadata round-trip
+        to find out whether the re-send could be skipped.
+        """
+        if not self.current_manual_settings:
+            return
+        try:
+            self.picam2.set_controls(self.current_manual_settings)
+            log.info("Manual exposure re-applied after capture.")
+        except Exception as e:
+            log.error(f"Error re-applying manual exposure settings: {e}")
+
+    @pyqtSlot()
+    def on_save_button_clicked(self):
+        # Handles clicks on the Save ('O') button.
+        if self.is_timer_countdown_active:
+            log.info("Save button ignored, timer is active.")
+            return # Do nothing if timer is running
+        else:
+            log.info("GUI Save ('O') button pressed, saving image immediately.")
+            self.save_image()
+            # Re-apply manual exposure if it was set
+            self.reapply_manual_exposure_if_needed()
+
+    @pyqtSlot()
+    def on_timer_button_clicked(self):
+        #Handles clicks on the Timer ('10s') button.
+        if self.is_timer_countdown_active:
+            # Cancel the timer - stop() genuinely cancels the pending timeout
+            self.self_timer.stop()
+            self.is_timer_countdown_active = False
+            set_button_active(self.btn_timer, False) # Reset to inactive style
+            log.info("Self-timer cancelled.")
+        else:
+            # Start the timer (one reusable QTimer, no per-press allocation)
+            self.is_timer_countdown_active = True
+            set_button_active(self.btn_timer, True) # Active style (red text)
+            log.info("Self-timer started (10s)...")
+            self.self_timer.start(TIMER_DELAY_MS)
+
+    @pyqtSlot()
+    def on_wifi_button_clicked(self):
+        #Handles clicks on the 'WiFi' button as master ON/OFF switch.
+        target_state_on = not self.is_wifi_on # Determine desired state
+
+        if target_state_on:
+            log.info("WiFi button: Turning ON (Activating Client mode)...")
+            # Ensure AP mode state variable is false and button looks inactive
+            self.is_ap_mode_active = False
+            set_button_active(self.btn_ap, False) # Ensure inactive style
+
+            if start_client_mode():
+                log.info("WiFi ON (Client Mode).")
+                self.is_wifi_on = True
+                set_button_active(self.btn_wifi, True) # Active style
+                self.btn_ap.setEnabled(True) # Enable AP button
+            else:
+                log.error("Failed to start Client mode services. Turning radio off.")
+                run_system_command(['sudo', '/usr/sbin/rfkill', 'block', 'wifi']) # Block radio on failure
+                self.is_wifi_on = False
+                set_button_active(self.btn_wifi, False) # Inactive style
+                self.btn_ap.setEnabled(False) # Disable AP button
+        else:
+            # Turning WiFi OFF
+            log.info("WiFi button: Turning OFF...")
+            stop_success = False
+            if self.is_ap_mode_active:
+                log.info("Stopping AP mode services...")
+                stop_success = stop_ap_mode() # Calls function with real commands
+            else:
+                # If not in AP mode, must be in Client mode (or trying to be)
+                log.info("Stopping Client mode services...")
+                stop_success = stop_client_mode() # Calls function with real commands
+
+            log.info("Blocking WiFi radio...")
+            rfkill_success = run_system_command(['sudo', '/usr/sbin/rfkill', 'block', 'wifi'])
+
+            if stop_success and rfkill_success:
+                log.info("WiFi OFF.")
+                self.is_wifi_on = False
+                self.is_ap_mode_active = False # Ensure AP state is also off
+                set_button_active(self.btn_wifi, False) # Inactive style for WiFi button
+                set_button_active(self.btn_ap, False) # Inactive style for AP button
+                self.btn_ap.setEnabled(False) # Disable AP button
+            else:
+                log.error("Failed to properly turn off WiFi/Services. State may be inconsistent.")
+                # Attempt to revert visual state if turn-off failed
+                self.is_wifi_on = True # Assume it's still effectively on
+                set_button_active(self.btn_wifi, True) # Active style
+                self.btn_ap.setEnabled(True) # Keep AP button enabled
 
-        painter.end()
+    @pyqtSlot()
+    def on_ap_button_clicked(self):
+        #Handles clicks on the 'AP' button to switch network mode.
+        if not self.is_wifi_on:
+            log.info("AP button clicked, but WiFi is OFF. Ignoring.")
+            return # Do nothing if WiFi master switch is off
 
-        # Update the label
-        label.setPixmap(pix)
-    except Exception as e:
-        print(f"Error updating preview: {e}")
-        traceback.print_exc() # Print full traceback for debugging preview errors
+        target_ap_on = not self.is_ap_mode_active # Determine desired AP state
 
-# Image Saving Function
-def save_image():
-    # Captures and saves a full-resolution image.
-    print("Saving image...")
-    timestamp = time.strftime("%Y%m%d%H%M%S")
-    filename = f"{timestamp}.jpg"
-    save_dir = "/srv/DCIM/" # Target save directory
+        success = False
+        if target_ap_on:
+            # Switching Client -> AP
+            log.info("AP button: Attempting switch Client -> AP mode...")
+            if stop_client_mode():
+                if start_ap_mode():
+                    # Hotspot is up. Give the AP network time to stabilize
+                    # before starting Samba; the wait runs on a QTimer so
+                    # the preview and shutter stay responsive, and the
+                    # network buttons are locked until finish_ap_bringup
+                    # completes.
+                    self.btn_ap.setEnabled(False)
+                    self.btn_wifi.setEnabled(False)
+                    log.info(f"Waiting {AP_STABILIZE_DELAY_S} seconds for AP network to stabilize...")
+                    QTimer.singleShot(AP_STABILIZE_DELAY_S * 1000, self.finish_ap_bringup)
+                    return
+                else:
+                    log.error("Failed to start AP mode services after stopping client. Attempting to revert to Client mode...")
+                    start_client_mode() # Try to go back to client mode
+            else:
+                log.error("Failed to stop client mode services before starting AP.")
 
-    try:
-        # Ensure save directory exists
-        os.makedirs(save_dir, exist_ok=True)
-        filepath = os.path.join(save_dir, filename)
-
-        # Configure for high-resolution still capture
-        # Use sensor resolution for maximum quality
-        # Important: Create a *copy* of current manual settings if active,
-        # otherwise use default still config. Don't modify global dict here.
-        if current_manual_settings:
-             # Use manual settings for the capture, but ensure format/size are appropriate
-             still_controls = current_manual_settings.copy()
-             still_config = picam2.create_still_configuration(
-                 main={"format": "XRGB8888", "size": picam2.sensor_resolution},
-                 controls=still_controls
-             )
-             print("Using manual settings for still capture.")
+            log.error("Failed to switch to AP mode. Reverting selection visuals.")
+            self.is_ap_mode_active = False # Stay in client mode logically
+            set_button_active(self.btn_ap, False) # Inactive style
         else:
-             # Use default auto settings for capture
-             still_config = picam2.create_still_configuration(
-                 main={"format": "XRGB8888", "size": picam2.sensor_resolution}
-                 # No explicit controls means it uses auto-exposure for the capture
-             )
-             print("Using auto settings for still capture.")
-
-        # Set JPEG quality (optional, default is often reasonable)
-        picam2.options['quality'] = 95 # 0-95, higher is better quality/larger file
-
-        print(f"Attempting to save still to {filepath}...")
-        # Use switch_mode_and_capture_file for efficient high-res capture
-        job_maybe_dict = picam2.switch_mode_and_capture_file(still_config, filepath)
-        print(f"Image save process initiated/completed for: {filepath}")
+            # Switching AP -> Client
+            log.info("AP button: Attempting switch AP -> Client mode...")
+            if stop_ap_mode():
+                if start_client_mode(): # Calls function with dnsmasq enable/start
+                    success = True
+                else:
+                    log.error("Failed to start Client mode services after stopping AP. Attempting to revert to AP mode...")
+                    start_ap_mode() # Try to go back to AP mode
+            else:
+                log.error("Failed to stop AP mode services before starting client.")
 
-    except Exception as e:
-        print(f"Error saving image: {e}")
-        traceback.print_exc() # Print full traceback for debugging saving errors
-
-# Self-Timer Callback Function
-def delayed_capture_and_reset():
-    # Called by QTimer after delay. Captures image if not cancelled.
-    global is_timer_countdown_active, btn_timer, button_style_sheet
-    capture_done = False
-    if is_timer_countdown_active:
-        # Timer completed normally
-        print("Timer finished! Capturing image now...")
-        save_image()
-        capture_done = True # Mark capture as done
-    else:
-        # Timer was cancelled before completion
-        print("Timer finished, but capture was cancelled by user.")
-
-    # Reset timer state and button style regardless of capture
-    is_timer_countdown_active = False
-    if btn_timer: # Check if button widget exists
-        btn_timer.setStyleSheet(button_style_sheet) # Use original base style
-
-    # Re-apply manual exposure if needed *after* capture and timer reset
-    if capture_done:
-        reapply_manual_exposure_if_needed()
-
-# gpiozero Button Handler
-def handle_capture_press():
-    #Callback function for gpiozero button press.
-    global is_timer_countdown_active
-    if is_timer_countdown_active:
-        print("Timer countdown active, physical button press ignored.")
-    else:
-        print("Physical button pressed (gpiozero), saving image immediately.")
-        save_image()
-        # Re-apply manual exposure if it was set
-        reapply_manual_exposure_if_needed()
+            if success:
+                log.info("Successfully switched to Client mode.")
+                self.is_ap_mode_active = False
+                set_button_active(self.btn_ap, False) # Inactive style
+            else:
+                log.error("Failed to switch to Client mode. Reverting selection visuals.")
+                self.is_ap_mode_active = True # Stay in AP mode logically
+                set_button_active(self.btn_ap, True) # Active style
+
+    @pyqtSlot()
+    def finish_ap_bringup(self):
+        #Deferred second half of AP bring-up. Scheduled via
+        #QTimer.singleShot AP_STABILIZE_DELAY_S seconds after the hotspot
+        #came up, so the preview and buttons keep running during the
+        #stabilization wait.
+        # Re-enabled Samba Start for AP Mode
+        log.info("--> Starting Samba services (nmbd, smbd) for AP mode...")
+        if _system_bus is not None:
+            samba_ok = systemd_unit_action('start', 'nmbd') and systemd_unit_action('start', 'smbd')
+        else:
+            samba_ok = run_system_batch("/bin/systemctl start nmbd; /bin/systemctl start smbd")
+        if samba_ok:
+            log.info("Successfully switched to AP mode.")
+            self.is_ap_mode_active = True
+            set_button_active(self.btn_ap, True) # Active style
+        else:
+            log.error("Failed to start Samba services in AP mode. Attempting to revert to Client mode...")
+            stop_ap_mode()
+            start_client_mode() # Try to go back to client mode
+            self.is_ap_mode_active = False
+            set_button_active(self.btn_ap, False) # Inactive style
+        # Re-enable the buttons that were locked during the transition
+        self.btn_ap.setEnabled(True)
+        self.btn_wifi.setEnabled(True)
+
+    # Exposure Button Handler
+    @pyqtSlot()
+    def on_exposure_button_clicked(self):
+        #Handles clicks on the bottom exposure time buttons.
+        # One shared slot for all exposure buttons: the pressed button is
+        # recovered via sender() and its label looked up in a dict,
+        # instead of creating a fresh Python closure per button at
+        # construction time (undecorated lambda connections also pay a
+        # per-emission wrapper).
+        sender = self.sender()
+        label = self.exposure_label_by_btn.get(sender)
+        if label is None:
+            return # Exit if sender is somehow invalid
+
+        if self.active_exposure_button == sender:
+            # --- Revert to auto exposure ---
+            set_button_active(sender, False) # Deactivate button visually
+            self.active_exposure_button = None
+            self.current_manual_settings = None # Clear stored manual settings
+            self.still_config_manual = None # save_image falls back to the auto config
+            log.info("Attempting to re-enable Auto Exposure...")
+            try:
+                # Use general_settings which now doesn't explicitly set AnalogueGain
+                self.picam2.set_controls(self.general_settings)
+                log.info("Auto Exposure Re-enabled using set_controls")
+            except Exception as e:
+                # AeEnable & friends are runtime controls on the IMX477, so a
+                # stop/configure/start cycle is never needed - it would stall
+                # the pipeline for 100s of ms and reallocate buffers. Log the
+                # error and keep the previous state instead.
+                log.error(f"Error re-enabling auto exposure: {e}")
+        else:
+            # Set manual exposure
+            # Deactivate previously active button (if any)
+            if self.active_exposure_button:
+                set_button_active(self.active_exposure_button, False)
+
+            # Activate the newly clicked button
+            set_button_active(sender, True) # Red text style
+            self.active_exposure_button = sender
+            exposure_time = exposure_times[label]
+            # Define the manual settings dictionary
+            manual_settings = {
+                "AnalogueGain": 1.0, # Explicitly set gain for manual mode
+                "AeEnable": False, # Disable Auto Exposure
+                "ExposureTime": exposure_time, # Set manual time
+                "AwbEnable": True, # Keep Auto White Balance (mode stays at its default)
+            }
+            # Store the settings on the app object
+            self.current_manual_settings = manual_settings
+            # Rebuild the cached manual still configuration here, so
+            # save_image doesn't have to create one on the shutter-lag path.
+            self.still_config_manual = self.picam2.create_still_configuration(
+                main={"format": "YUV420", "size": self.picam2.sensor_resolution},
+                controls=self.current_manual_settings.copy()
+            )
+            log.info(f"Attempting to set Manual Exposure: {label} ({exposure_time} us)")
+            try:
+                self.picam2.set_controls(manual_settings)
+                log.info(f"Manual Exposure Set using set_controls")
+            except Exception as e:
+                # See the auto branch above: these are all runtime controls,
+                # so no configure fallback - log and keep the previous state.
+                log.error(f"Error setting manual exposure: {e}")
+    # End on_exposure_button_clicked
+
+    @pyqtSlot()
+    def on_shutdown_button_clicked(self):
+        #Handles clicks on the Shutdown ('I/O') button.
+        log.info("Shutdown button clicked.")
+        self.confirm_overlay.ask()
+
+    # Image Saving Function
+    def save_image(self):
+        # Captures and saves a full-resolution image.
+        log.info("Saving image...")
+        timestamp = time.strftime("%Y%m%d%H%M%S")
+        filename = f"{timestamp}.jpg"
 
-# Define gpiozero Button Object
-capture_button = None
-try:
-    # Initialize the button connected to the specified GPIO pin
-    capture_button = Button(button_pin, pull_up=True, bounce_time=0.3) # Debounce time
-    # Assign the handler function to the button's press event
-    capture_button.when_pressed = handle_capture_press
-    print(f"gpiozero button initialized for pin {button_pin}.")
-except Exception as e:
-    # Catch errors during button initialization (e.g., pin unavailable, library issues)
-    print(f"!!!!!!!!!!\nERROR initializing gpiozero Button on pin {button_pin}: {e}\nPhysical button capture will NOT work.\n!!!!!!!!!!")
-    traceback.print_exc()
+        try:
+            # SAVE_DIR was created at startup
+            filepath = os.path.join(SAVE_DIR, filename)
+
+            # Pick the pre-built still configuration (built at startup for
+            # auto, rebuilt in the exposure handler for manual) - nothing is
+            # allocated or validated on the shutter-press path.
+            if self.still_config_manual is not None:
+                 still_config = self.still_config_manual
+                 log.info("Using manual settings for still capture.")
+            else:
+                 still_config = self.still_config_auto
+                 log.info("Using auto settings for still capture.")
+
+            # Set JPEG quality (optional, default is often reasonable)
+            self.picam2.options['quality'] = 95 # 0-95, higher is better quality/larger file
+
+            log.info(f"Attempting to save still to {filepath}...")
+            # Use switch_mode_and_capture_file for efficient high-res capture
+            job_maybe_dict = self.picam2.switch_mode_and_capture_file(still_config, filepath)
+            log.info(f"Image save process initiated/completed for: {filepath}")
+
+        except Exception:
+            log.exception("Error saving image") # Full traceback for debugging saving errors
+
+    # Self-Timer Callback Function
+    @pyqtSlot()
+    def delayed_capture_and_reset(self):
+        # Called by the self-timer's timeout. A cancelled countdown never
+        # gets here (self_timer.stop() cancels the pending timeout), so no
+        # was-it-cancelled bookkeeping is needed.
+        log.info("Timer finished! Capturing image now...")
+        self.save_image()
+
+        # Reset timer state and button style
+        self.is_timer_countdown_active = False
+        set_button_active(self.btn_timer, False) # Reset to inactive style
+
+        # Re-apply manual exposure if needed *after* capture and timer reset
+        self.reapply_manual_exposure_if_needed()
+
+    # gpiozero Button Handlers
+    def on_physical_button(self):
+        # when_pressed fires on gpiozero's own callback thread (pigpio
+        # event thread or the default factory's edge-watcher), so touching
+        # Qt widgets or the camera from here directly is unsafe. Queue the
+        # real handler onto the GUI thread instead; the press itself is
+        # still edge-triggered, no polling anywhere.
+        QMetaObject.invokeMethod(self, "handle_capture_press", Qt.QueuedConnection)
+
+    @pyqtSlot()
+    def handle_capture_press(self):
+        #Runs on the GUI thread, queued from on_physical_button.
+        if self.is_timer_countdown_active:
+            log.info("Timer countdown active, physical button press ignored.")
+        else:
+            log.info("Physical button pressed (gpiozero), saving image immediately.")
+            self.save_image()
+            # Re-apply manual exposure if it was set
+            self.reapply_manual_exposure_if_needed()
+
+    # Consolidated cleanup
+    def proper_cleanup(self):
+        # Stops timers, camera, and closes gpiozero button. Plain
+        # attribute checks - the old "'x' in globals()" probes walked a
+        # fresh dict view per call and only existed because the state
+        # lived at module scope.
+        log.info("Performing final cleanup...")
+        # Detach the camera frame callback so no more GUI updates are queued
+        try:
+            if self.picam2 is not None:
+                self.picam2.post_callback = None
+                log.info("Camera frame callback removed.")
+        except Exception as e:
+            log.error(f"Error removing camera frame callback during cleanup: {e}")
+
+        # Stop Picamera2 and close the gpiozero button concurrently.
+        # stop() blocks until the ISP pipeline drains (hundreds of ms)
+        # and close() joins gpiozero's callback thread; the two are
+        # independent, so total teardown is max of the two instead of
+        # their sum.
+        jobs = []
+        if self.picam2 is not None and self.picam2.started:
+            log.info("Stopping Picamera2...")
+            jobs.append(("stopping camera", self.picam2.stop))
+        if self.capture_button is not None and not self.capture_button.closed:
+            jobs.append(("closing gpiozero button", self.capture_button.close))
+        if jobs:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                futures = [(what, executor.submit(fn)) for what, fn in jobs]
+                for what, future in futures:
+                    e = future.exception()
+                    if e is not None:
+                        log.error(f"Error {what} during cleanup: {e}")
+                    else:
+                        log.info(f"Cleanup: {what} done.")
+
+        log.info("Application finished (physical cleanup).")
 
 # --- PyQt5 Application Setup ---
-print("Setting up application...")
+log.info("Setting up application...")
+# Disable vsync throttling on any GL surface Qt may create: with the
+# default swapInterval of 1 the event loop can end up gated on vblank
+# inside SwapBuffers, silently dropping an ~30 fps preview towards 15.
+# Tradeoff: a GL surface could tear; the raster path is unaffected.
+# Must be set before the QApplication is constructed.
+surface_format = QSurfaceFormat()
+surface_format.setSwapInterval(0)
+QSurfaceFormat.setDefaultFormat(surface_format)
 app = QApplication(sys.argv)
-window = QWidget()
-window.setStyleSheet("background-color: black;")
-window.setFixedSize(720, 792) # Fixed size: 720 width, 720 preview + 2*36 button bars
-window.setWindowFlags(Qt.FramelessWindowHint) # Remove window decorations
-
-# Main vertical layout
-main_layout = QVBoxLayout()
-main_layout.setContentsMargins(0, 0, 0, 0) # No margins
-main_layout.setSpacing(0) # No spacing between elements
-
-# --- Top Button Bar GUI ---
-top_button_layout = QHBoxLayout()
-top_button_layout.setContentsMargins(0, 0, 0, 0)
-top_button_layout.setSpacing(0)
-# Create Buttons
-btn_save = QPushButton("O") # Capture/Save button
-btn_save.setFixedSize(72, 36)
-btn_save.setStyleSheet(button_style_sheet) # Use original base style
-btn_save.clicked.connect(on_save_button_clicked)
-
-btn_timer = QPushButton("10s") # Self-timer button
-btn_timer.setFixedSize(72, 36)
-btn_timer.setStyleSheet(button_style_sheet) # Use original base style
-btn_timer.clicked.connect(on_timer_button_clicked)
-
-btn_ap = QPushButton("AP") # Access Point mode button
-btn_ap.setFixedSize(72, 36)
-btn_ap.setStyleSheet(button_style_sheet) # Use original base style
-btn_ap.clicked.connect(on_ap_button_clicked)
-
-btn_wifi = QPushButton("WiFi") # Master WiFi on/off button
-btn_wifi.setFixedSize(72, 36)
-# Set initial style based on startup check
-if is_wifi_on:
-    btn_wifi.setStyleSheet(active_style_sheet_red) # Active style
-else:
-    btn_wifi.setStyleSheet(button_style_sheet) # Inactive style
-btn_wifi.clicked.connect(on_wifi_button_clicked)
-
-btn_shutdown = QPushButton("I/O") # Shutdown button
-btn_shutdown.setFixedSize(72, 36)
-btn_shutdown.setStyleSheet(button_style_sheet) # Use original base style
-btn_shutdown.clicked.connect(on_shutdown_button_clicked)
-
-# Set initial enabled state for AP button based on wifi state
-if not is_wifi_on:
-    btn_ap.setEnabled(False)
-
-# Add Widgets to TOP button layout: O | 10s | Stretch | WiFi | AP | I/O
-top_button_layout.addWidget(btn_save)
-top_button_layout.addWidget(btn_timer)
-top_button_layout.addStretch(1) # Pushes right-side buttons to the right
-top_button_layout.addWidget(btn_wifi)
-top_button_layout.addWidget(btn_ap)
-top_button_layout.addWidget(btn_shutdown)
-# Removed battery_label addition
-
-main_layout.addLayout(top_button_layout) # Add top bar to main layout
-
-# --- Preview Label GUI ---
-preview_label = QLabel() # Label to display the camera preview
-preview_label.setFixedSize(720, 720) # Square preview area
-preview_label.setStyleSheet("margin: 0px; padding: 0px; border: 0px;") # Ensure no extra space
-main_layout.addWidget(preview_label) # Add preview label to main layout
-
-# Bottom Button Bar GUI (Exposure Times)
-bottom_button_layout = QHBoxLayout()
-bottom_button_layout.setContentsMargins(0, 0, 0, 0)
-bottom_button_layout.setSpacing(0)
-# Create buttons for each exposure time
-for label in exposure_times.keys():
-    button = QPushButton(label)
-    button.setFixedSize(72, 36)
-    button.setStyleSheet(button_style_sheet) # Use original base style
-    # Use lambda to pass button widget and label to the handler
-    button.clicked.connect(lambda checked, b=button, l=label: on_exposure_button_clicked(b, l))
-    bottom_button_layout.addWidget(button)
-main_layout.addLayout(bottom_button_layout) # Add bottom bar to main layout
-
-# Finalize Layout & Show Window
-window.setLayout(main_layout)
-window.showFullScreen() # Show the window in full screen mode
-
-# Setup Preview Update Timer
-preview_timer = QTimer() # Timer to refresh the preview label
-preview_timer.timeout.connect(lambda: update_preview(preview_label)) # Connect timeout signal
-print("Starting preview timer...")
-preview_timer.start(33) # Update roughly 30 times per second (1000ms / 30fps ≈ 33ms)
-
-# Define consolidated cleanup function
-def proper_cleanup():
-    # Stops timers, camera, and closes gpiozero button.
-    print("Performing final cleanup...")
-    if 'preview_timer' in globals() and preview_timer and preview_timer.isActive():
-        preview_timer.stop()
-        print("Preview timer stopped.")
-
-    # Stop Picamera2 if it's running
-    try:
-        # Check if picam2 exists and is the correct type before trying to stop
-        if 'picam2' in globals() and isinstance(picam2, Picamera2) and picam2.started:
-            print("Stopping Picamera2...")
-            picam2.stop()
-            print("Picamera2 stopped.")
-    except Exception as e:
-        print(f"Error stopping camera during cleanup: {e}")
-
-    # Close gpiozero button if it exists and is open
-    try:
-        if 'capture_button' in globals() and capture_button and not capture_button.closed:
-            capture_button.close()
-            print("gpiozero button closed.")
-    except Exception as e:
-        print(f"Error closing gpiozero button during cleanup: {e}")
-
-    print("Application finished (physical cleanup).")
-
-# Register the cleanup function to run on script exit
-atexit.register(proper_cleanup)
+# Button styling lives on the application: parsed exactly once and
+# shared by every QPushButton; state toggles only flip the "active"
+# dynamic property (see set_button_active)
+app.setStyleSheet(button_style_sheet)
+# Everything else - camera, buffers, widgets, handlers - lives on one
+# PicaApp object
+pica = PicaApp(initial_services_ok)
 
 # Run Application Event Loop
-print("Starting application event loop...")
+log.info("Starting application event loop...")
 exit_code = 0
 try:
     # Start the Qt event loop
     exit_code = app.exec_()
-    print(f"Application event loop finished normally with exit code: {exit_code}")
+    log.info(f"Application event loop finished normally with exit code: {exit_code}")
 except KeyboardInterrupt:
     # Handle Ctrl+C gracefully
-    print("\nKeyboardInterrupt caught, exiting...")
+    log.info("KeyboardInterrupt caught, exiting...")
     exit_code = 1 # Indicate exit via interrupt
-except Exception as e:
+except Exception:
     # Catch any other unhandled exceptions during the event loop
-    print(f"\nUnhandled exception in Qt event loop: {e}")
-    traceback.print_exc()
+    log.exception("Unhandled exception in Qt event loop")
     exit_code = 2 # Indicate exit due to error
 finally:
-    # This block runs regardless of how the try block exits
-    # Note: atexit cleanup runs *after* this finally block if sys.exit() is called
-    print(f"Exiting script with code {exit_code}...")
-    # Ensure sys.exit is called to trigger atexit handlers properly
+    # This block runs regardless of how the try block exits.
+    # Cleanup runs here synchronously rather than via atexit: an atexit
+    # hook fires during interpreter shutdown, when module globals may
+    # already be cleared and Picamera2/libcamera teardown is known to
+    # hang. Here everything is still fully alive.
+    pica.proper_cleanup()
+    log.info(f"Exiting script with code {exit_code}...")
     sys.exit(exit_code)
-